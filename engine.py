@@ -1,16 +1,21 @@
 import os
 import chess
 import chess.engine
-
-# Material values for each piece
-PIECE_VALUES = {
-    chess.PAWN: 100,
-    chess.KNIGHT: 300,
-    chess.BISHOP: 300,
-    chess.ROOK: 500,
-    chess.QUEEN: 900,
-    chess.KING: 20000
-}
+import threading
+from collections import deque, OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+# Material values for each piece, indexed by piece type (index 0 is unused)
+PIECE_VALUES = (
+    0,      # No piece
+    100,    # chess.PAWN
+    300,    # chess.KNIGHT
+    300,    # chess.BISHOP
+    500,    # chess.ROOK
+    900,    # chess.QUEEN
+    20000   # chess.KING
+)
 
 # Tactic type with numeric identifiers
 TACTIC_TYPES = {
@@ -21,21 +26,42 @@ TACTIC_TYPES = {
     "Skewer": 4
 }
 
+# Number of engine processes analysing tactic search positions in parallel
+SEARCH_WORKERS = min(os.cpu_count(), 4)
+
+# Maximum number of analyses kept in the engine's analysis cache
+ANALYSIS_CACHE_SIZE = 200_000
+
+# Maximum number of tactic check results kept in the engine's tactic cache
+TACTIC_CACHE_SIZE = 100_000
+
+# Tactic names indexed by tactic type
+TACTIC_NAMES = tuple(TACTIC_TYPES.keys())
+
+# Squares strictly between two squares on a shared line, indexed by [a][b]
+BETWEEN = [[chess.between(a, b) for b in chess.SQUARES] for a in chess.SQUARES]
+
 class Tactic:
     """Represents a tactic with a sequence of moves and a tactic type"""
 
     def __init__(self, sequence: list, score: int, type: int) -> None:
         """Initialize a tactic with a principal variation and type."""
-        self.sequence = sequence
+        self.sequence = tuple(sequence)
         self.type = type
         self.score = score
-        self.index = 0
         self.max_index = len(sequence) - 1
+        self.set_index(0)
+
+    def set_index(self, index: int) -> None:
+        """Move to the given index in the tactic sequence."""
+        self.index = index
+        # Player moves remaining, stored so the GUI can read it every frame without recomputing
+        self.player_moves_left = ((self.max_index - index) // 2) + 1
 
     def next_move(self) -> chess.Move:
         """Get the next move in the tactic sequence and advance the index."""
         move = self.sequence[self.index]
-        self.index += 1
+        self.set_index(self.index + 1)
         return move
     
     def hint_move(self) -> chess.Move:
@@ -43,39 +69,54 @@ class Tactic:
         return self.sequence[self.index]
     
     def moves_left(self) -> int:
-        """Calculate the number of player moves remaining in the tactic."""
-        return ((self.max_index - self.index) // 2) + 1
+        """Get the number of player moves remaining in the tactic."""
+        return self.player_moves_left
     
     def pretty_print(self) -> None:
         """Pretty print the tactic sequence."""
-        print(f"=== Tactic Found: {list(TACTIC_TYPES.keys())[self.type]} ===")
+        print(f"=== Tactic Found: {TACTIC_NAMES[self.type]} ===")
         print(f"Sequence Length: {len(self.sequence)} moves")
         print(f"Position Evaluation: {self.score}")
         print("Principal Variation:")
-        for move in self.sequence:
-            print(move.uci(), end=" ")
-        print("\n")
+        print(" ".join(move.uci() for move in self.sequence), "\n")
 
 class TacticsEngine:
     def __init__(self, engine_path: str, board: chess.Board, engine_colour: chess.Color) -> None:
         """Initialize the tactics engine."""
         self.board = board
         self.engine_path = engine_path
+        # Engine for the normal moves, and a pool of engines for the tactic search
         self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        self.engines = [chess.engine.SimpleEngine.popen_uci(self.engine_path) for _ in range(SEARCH_WORKERS)]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.engines))
         self.optimum_engine_settings()
+        # Game token, the engine hash table is kept between analyses of the same game
+        self.game = object()
+        # Analyses keyed by position, limit and number of lines, least recently used first
+        self.analysis_cache = OrderedDict()
+        self.analysis_cache_lock = threading.Lock()
+        # Background analysis of the expected position after the player's reply, with its cache key
+        self.prefetch = None
+        # Analyses running on the search pool, stopped once the search no longer needs them
+        self.search_analyses = []
+        self.search_stopped = False
+        self.search_lock = threading.Lock()
         self.engine_colour = engine_colour
         self.current_tactic = None
-        self.tactic_types = list(TACTIC_TYPES.values())
+        self.set_tactic_types(list(TACTIC_TYPES.values()))
 
         # Search settings
         self.max_search_depth = 20
         self.search_limit = chess.engine.Limit(depth=14)
+        # Positions below the root are analysed less deeply, they are only used to follow forcing lines
+        self.inner_search_limit = chess.engine.Limit(depth=12)
         self.search_pv = 5
         self.err_bound = 50
         self.only_move_bound = 300
         
         # Engine settings
         self.engine_depth = None
+        self.engine_nodes = None
         self.bounds = {}
         self.normal_move_limit = None
 
@@ -83,8 +124,13 @@ class TacticsEngine:
         """Set the engine settings to optimum values depending on the system."""
         logical_core_count = os.cpu_count()
         hash_size_per_core = 64  # MiB
-        max_hash_size = logical_core_count * hash_size_per_core
-        self.engine.configure({"Threads": logical_core_count, "Hash": max_hash_size})
+        # The normal moves are never analysed during the tactic search, so their engine uses every core
+        self.engine.configure({"Threads": logical_core_count, "Hash": logical_core_count * hash_size_per_core})
+        # Share the cores and hash between the engines in the pool
+        threads_per_engine = max(1, logical_core_count // len(self.engines))
+        hash_per_engine = threads_per_engine * hash_size_per_core
+        for engine in self.engines:
+            engine.configure({"Threads": threads_per_engine, "Hash": hash_per_engine})
 
     def set_difficulty(self, value: int) -> None:
         """Configure engine parameters based on difficulty level."""
@@ -92,23 +138,37 @@ class TacticsEngine:
         if value == 0:
             self.num_pv = 7
             self.engine_depth = 8
+            self.engine_nodes = 1_000_000
             self.bounds = {'min_bound': 500, 'forcing_bound': 250} # 300
         # Medium
         elif value == 1:
             self.num_pv = 5
             self.engine_depth = 12
+            self.engine_nodes = 4_000_000
             self.bounds = {'min_bound': 350, 'forcing_bound': 200}
         # Hard
         else:
             self.num_pv = 3
             self.engine_depth = 18
+            self.engine_nodes = 16_000_000
             self.bounds = {'min_bound': 250, 'forcing_bound': 150} # 200
         
-        self.normal_move_limit = chess.engine.Limit(time=10.0, depth=self.engine_depth)
+        # Node budget instead of a time limit, so the search does not depend on machine speed
+        self.normal_move_limit = chess.engine.Limit(depth=self.engine_depth, nodes=self.engine_nodes)
 
     def set_tactic_types(self, types: list[int]) -> None:
         """Set the types of tactics to search for."""
-        self.tactic_types = types
+        self.tactic_types = frozenset(types)
+        # Tactic check results depend on the enabled types, so earlier results are dropped
+        # Results are kept least recently used first, like the analysis cache
+        self.tactic_cache = OrderedDict()
+        # Resolved once here rather than on every position of the search
+        self.check_checkmate = TACTIC_TYPES["Checkmate"] in self.tactic_types
+        self.check_fork = TACTIC_TYPES["Fork"] in self.tactic_types
+        self.check_skewer = TACTIC_TYPES["Skewer"] in self.tactic_types
+        self.check_absolute_pin = TACTIC_TYPES["Absolute Pin"] in self.tactic_types
+        self.check_relative_pin = TACTIC_TYPES["Relative Pin"] in self.tactic_types
+        self.check_positions = self.check_fork or self.check_skewer or self.check_absolute_pin or self.check_relative_pin
     
     def only_move(self, analysis: list[dict] = None, best_score: int = None) -> chess.Move:
         """Check if there's an obvious move to play."""
@@ -116,7 +176,7 @@ class TacticsEngine:
         if len(analysis) == 1:
             return current_move
         
-        second_score = analysis[1]["score"].pov(self.engine_colour).score(mate_score=100000)
+        second_score = analysis[1]["score"]
 
         # If best move has minor piece advantage, return it
         if best_score >= second_score + self.only_move_bound:
@@ -124,13 +184,14 @@ class TacticsEngine:
         else:
             return None
     
-    def _select_normal_move(self) -> chess.Move:
+    def _select_normal_move(self, analysis: list[dict] = None) -> chess.Move:
         """Selects the least losing move based on the position evaluation."""
-        analysis = self.engine.analyse(self.board, self.normal_move_limit, multipv=self.num_pv)
+        if analysis == None:
+            analysis = self._analyse(self.engine, self.board, self.normal_move_limit, self.num_pv)
         for infodict in analysis:
             pv = infodict["pv"]
             current_move = pv[0]
-            score = infodict["score"].pov(self.engine_colour).score(mate_score=100000)
+            score = infodict["score"]
             if score <= 0:
                 return current_move
 
@@ -147,35 +208,87 @@ class TacticsEngine:
 
     def play_move(self) -> chess.Move:
         """Determine the move for the engine to play."""
+        self._finish_prefetch()
         # Check if we're in the middle of a tactic
         if self.current_tactic:
             return self._select_tactic_move()
 
-        analysis = self.engine.analyse(self.board, self.normal_move_limit, multipv=2)
-        best_score = analysis[0]["score"].pov(self.engine_colour).score(mate_score=100000)
+        # Analysed once with enough lines for both the only move check and the normal move selection
+        analysis = self._analyse(self.engine, self.board, self.normal_move_limit, max(self.num_pv, 2))
+        best_score = analysis[0]["score"]
         # Checkmate line for engine
         if best_score > 10000:
-            return analysis[0]["pv"][0]
-        
-        # Only move available
-        move = self.only_move(analysis, best_score)
-        if move:
-            return move
-        
-        # Tactic search
-        self.tactic_search()
-        # Check if a tactic was found
-        if self.current_tactic:
-            return self.current_tactic.next_move()
+            move = analysis[0]["pv"][0]
+        else:
+            # Only move available
+            move = self.only_move(analysis, best_score)
+            if not move:
+                # Tactic search
+                self.tactic_search()
+                # Check if a tactic was found
+                if self.current_tactic:
+                    return self.current_tactic.next_move()
+
+                move = self._select_normal_move(analysis)
+
+        self._start_prefetch(analysis, move)
+        return move
 
-        return self._select_normal_move()
+    def _start_prefetch(self, analysis: list[dict], move: chess.Move) -> None:
+        """Start analysing the position after the expected reply to the engine's move while the player thinks."""
+        pv = next((infodict["pv"] for infodict in analysis if infodict["pv"][0] == move), None)
+        if pv == None or len(pv) < 2:
+            return
+
+        board = self.board.copy(stack=1)
+        board.push(pv[0])
+        board.push(pv[1])
+        if board.is_game_over():
+            return
+
+        num_pv = max(self.num_pv, 2)
+        key = self._analysis_key(board, self.normal_move_limit, num_pv)
+        self.prefetch = (key, self.engine.analysis(board, self.normal_move_limit, multipv=num_pv, game=self.game))
+
+    def _finish_prefetch(self) -> None:
+        """Wait for the background analysis if the player made the expected reply, otherwise stop it."""
+        if self.prefetch == None:
+            return
+
+        key, analysis = self.prefetch
+        self.prefetch = None
+        # Nothing to collect if the engine process has exited
+        if self.engine.protocol.returncode.done():
+            return
+
+        if key[0] != self.board._transposition_key():
+            analysis.stop()
+            analysis.wait()
+            return
+
+        analysis.wait()
+        self._store_analysis(key, analysis.multipv)
+
+    def _cancel_prefetch(self) -> None:
+        """Stop the background analysis and discard its result."""
+        if self.prefetch == None:
+            return
+
+        _, analysis = self.prefetch
+        self.prefetch = None
+        # Nothing to stop if the engine process has exited
+        if self.engine.protocol.returncode.done():
+            return
+
+        analysis.stop()
+        analysis.wait()
     
     def undo_tactic_move(self) -> None:
         """Undo a tactic move."""
         if self.current_tactic.index >= 2:
-            self.current_tactic.index -= 2
+            self.current_tactic.set_index(self.current_tactic.index - 2)
         elif self.current_tactic.index == 1:
-            self.current_tactic.index -= 1
+            self.current_tactic.set_index(0)
             self.end_tactic()
         else:
             self.end_tactic()
@@ -185,134 +298,271 @@ class TacticsEngine:
         self.current_tactic = None
         self.tactic_search()
 
-    def _process_engine_moves(self, board: chess.Board, depth: int, sequence: list, analysis: list[dict], search_queue: list, best_score: int) -> list:
-        """Process engine moves in the search stack."""
+    def _process_engine_moves(self, board: chess.Board, depth: int, sequence: list, analysis: list[dict], search_queue: deque, best_score: int) -> None:
+        """Process engine moves in the search queue."""
+        # For initial position, consider all moves above the min mistake threshold
+        if depth == 0:
+            minimum_bound = best_score - self.bounds['min_bound']
+        # Otherwise, play normal moves (slightly suboptimal moves are acceptable)
+        else:
+            minimum_bound = best_score - self.err_bound
+
+        moves = []
         for infodict in analysis:
-            pv = infodict["pv"]
-            score = infodict["score"].pov(self.engine_colour).score(mate_score=100000)
-
-            # For initial position, consider all moves above the min mistake threshold
-            if depth == 0:
-                minimum_bound = best_score - self.bounds['min_bound']
-                if score >= minimum_bound:
-                    next_board = board.copy(stack=1)
-                    next_board.push(pv[0])
-                    search_queue.append((next_board, depth + 1, sequence + [pv[0]]))
-            # Otherwise, play normal moves (slightly suboptimal moves are acceptable)
-            elif score >= best_score - self.err_bound:
-                next_board = board.copy(stack=1)
-                next_board.push(pv[0])
-                search_queue.append((next_board, depth + 1, sequence + [pv[0]]))
-            
-        return search_queue
+            score = infodict["score"]
+
+            # Analysis is ordered best move first, so the remaining moves are below the bound too
+            if score < minimum_bound:
+                break
+
+            moves.append(infodict["pv"][0])
 
-    def _process_player_moves(self, board: chess.Board, depth: int, sequence: list, analysis: list[dict], search_queue: list, best_score: int) -> list:
-        """Process player moves in the search stack."""
+        if not moves:
+            return
+
+        for move in moves[:-1]:
+            next_board = board.copy(stack=1)
+            next_board.push(move)
+            search_queue.append((next_board, depth + 1, sequence + [move]))
+
+        # The node's board is not used again once processed, so the last move is played on it directly
+        board.push(moves[-1])
+        search_queue.append((board, depth + 1, sequence + [moves[-1]]))
+
+    def _process_player_moves(self, board: chess.Board, depth: int, sequence: list, analysis: list[dict], search_queue: deque, best_score: int) -> None:
+        """Process player moves in the search queue."""
         best_move_clear = False
         if len(analysis) == 1:
             best_move_clear = best_score <= -self.bounds['forcing_bound']
         elif len(analysis) >= 2:
-            second_score = analysis[1]["score"].pov(self.engine_colour).score(mate_score=100000)
+            second_score = analysis[1]["score"]
             best_move_clear = best_score <= second_score - self.bounds['forcing_bound']
 
         # If there's a clear best move, check for tactics
         if best_move_clear:
             pv = analysis[0]["pv"]
-            score = analysis[0]["score"].pov(self.engine_colour).score(mate_score=100000)
+            score = analysis[0]["score"]
             best_move = pv[0]
-            next_board = board.copy(stack=1)
-            next_board.push(best_move)
-
-            # Check if the move leads to a tactic
-            if len(pv) == 1:
-                tactic_type = self._position_tactic_check(next_board, None)
-            elif len(pv) >= 2:
-                tactic_type = self._position_tactic_check(next_board, pv[1])
-                
+            next_move = pv[1] if len(pv) >= 2 else None
+            # The position before the move, the move and the reply decide the result of the tactic check
+            tactic_key = (board._transposition_key(), best_move, next_move)
+            # The node's board is not used again once processed, so play the move on it directly
+            board.push(best_move)
+
+            # Check if the move leads to a tactic, reusing the result if the same line was checked before
+            tactic_type = self.tactic_cache.get(tactic_key)
+            if tactic_type == None:
+                tactic_type = self._position_tactic_check(board, next_move)
+                self.tactic_cache[tactic_key] = tactic_type
+                if len(self.tactic_cache) > TACTIC_CACHE_SIZE:
+                    self.tactic_cache.popitem(last=False)
+            else:
+                self.tactic_cache.move_to_end(tactic_key)
+
             if tactic_type >= 0:
                 self.current_tactic = Tactic(sequence + [best_move], score, tactic_type)
                 self.current_tactic.pretty_print()
-                return []
+                # Tactic found, stop the search
+                search_queue.clear()
             else:
                 # Continue search if no tactic found
-                search_queue.append((next_board, depth + 1, sequence + [best_move]))
-        
-        return search_queue
+                search_queue.append((board, depth + 1, sequence + [best_move]))
 
     def tactic_search(self) -> None:
         """Search for tactical opportunities in the current position."""
+        self._finish_prefetch()
+        # No tactic types enabled, nothing to search for
+        if not (self.check_checkmate or self.check_positions):
+            return
+
         initial_board = self.board.copy(stack=1)
-        search_queue = [(initial_board, 0, [])]
+        search_queue = deque([(initial_board, 0, [])])
+        # Transposition keys of positions already searched
+        visited = set()
+        futures = []
+        self.search_stopped = False
+        try:
+            while search_queue:
+                # Take the next positions in the queue, one for each engine in the pool
+                batch = []
+                while search_queue and len(batch) < len(self.engines):
+                    board, depth, sequence = search_queue.popleft()
+                    # Skip positions reached through a different move order, the first visit is always the shallowest
+                    position_key = board._transposition_key()
+                    if position_key in visited:
+                        continue
+                    visited.add(position_key)
 
-        while search_queue:
-            board, depth, sequence = search_queue.pop(0)
-            # Base case for search - max depth reached or game over
-            if depth == self.max_search_depth or board.is_game_over():
-                print("Game over or max depth reached.")
-                continue
+                    # Base case for search - max depth reached or game over
+                    if depth == self.max_search_depth or board.is_game_over():
+                        print("Game over or max depth reached.")
+                        continue
 
-            # If inital position and no mistake made yet, consider more moves
-            if depth == 0 and board.turn == self.engine_colour:
-                num_pv = board.legal_moves.count()
-            elif board.turn == self.engine_colour:
-                num_pv = min(board.legal_moves.count(), self.search_pv)
-            else:
-                num_pv = min(board.legal_moves.count(), 2)
-            
-            analysis = self.engine.analyse(board, self.search_limit, multipv=num_pv)
-            best_score = analysis[0]["score"].pov(self.engine_colour).score(mate_score=100000)
-            # Engine getting checkmated line
-            if depth == 0:
-                if best_score < -10000 and TACTIC_TYPES["Checkmate"] in self.tactic_types:
-                    self.current_tactic = Tactic(sequence + analysis[0]["pv"], best_score, TACTIC_TYPES["Checkmate"])
-                    self.current_tactic.pretty_print()
-                    return
-
-            # Engine turn
-            if board.turn == self.engine_colour:
-                search_queue = self._process_engine_moves(board, depth, sequence, analysis, search_queue, best_score)
-            # Human turn
-            else:
-                search_queue = self._process_player_moves(board, depth, sequence, analysis, search_queue, best_score)
+                    batch.append((board, depth, sequence))
+
+                # Analyse the batch in parallel, then process the results in queue order
+                futures = [self.executor.submit(self._analyse_search_position, engine, position)
+                           for engine, position in zip(self.engines, batch)]
+                for (board, depth, sequence), future in zip(batch, futures):
+                    analysis = future.result()
+                    best_score = analysis[0]["score"]
+                    # Engine getting checkmated line
+                    if depth == 0:
+                        if best_score < -10000 and self.check_checkmate:
+                            self.current_tactic = Tactic(sequence + analysis[0]["pv"], best_score, TACTIC_TYPES["Checkmate"])
+                            self.current_tactic.pretty_print()
+                            return
+
+                        # Only checkmate is enabled, so the positions below the root cannot contain a tactic
+                        if not self.check_positions:
+                            return
+
+                    # Engine turn
+                    if board.turn == self.engine_colour:
+                        self._process_engine_moves(board, depth, sequence, analysis, search_queue, best_score)
+                    # Human turn
+                    else:
+                        self._process_player_moves(board, depth, sequence, analysis, search_queue, best_score)
+
+                    # Tactic found, the rest of the batch is not needed
+                    if self.current_tactic:
+                        return
+        finally:
+            # Analyses of the batch that are no longer needed must not keep the engines busy
+            self._stop_search(futures)
+
+    def _analyse_search_position(self, engine: chess.engine.SimpleEngine, position: tuple) -> list[dict]:
+        """Analyse a tactic search position with the given engine from the pool."""
+        board, depth, _ = position
+
+        # If inital position and no mistake made yet, consider more moves
+        if depth == 0 and board.turn == self.engine_colour:
+            max_pv = None
+        elif board.turn == self.engine_colour:
+            max_pv = self.search_pv
+        else:
+            max_pv = 2
 
-    def _position_tactic_check(self, board: chess.Board, engine_move: chess.Move) -> tuple:
-        """Check if the given move sequence contains a tactical opportunity."""
-       
-        if TACTIC_TYPES["Fork"] in self.tactic_types:
-            forked_pieces = TacticSearch.fork(board, engine_move)
+        # Legal moves are generated lazily, so stop counting them once the limit is reached
+        num_pv = sum(1 for _ in islice(board.generate_legal_moves(), max_pv))
 
-            if forked_pieces:
-                return TACTIC_TYPES["Fork"]
-        
-        if TACTIC_TYPES["Skewer"] in self.tactic_types:
-            skewered_pieces = TacticSearch.skewer(board, engine_move)
-            if skewered_pieces:
-                return TACTIC_TYPES["Skewer"]
-            
-        if TACTIC_TYPES["Absolute Pin"] in self.tactic_types:
-            pinned_pieces = TacticSearch.absolute_pin(board, engine_move)
-            if pinned_pieces:
-                return TACTIC_TYPES["Absolute Pin"]
-        
-        if TACTIC_TYPES["Relative Pin"] in self.tactic_types:
-            relative_pins = TacticSearch.relative_pin(board, engine_move)
-            if relative_pins:
-                return TACTIC_TYPES["Relative Pin"]
-        
-        return -1
+        limit = self.search_limit if depth == 0 else self.inner_search_limit
+        key = self._analysis_key(board, limit, num_pv)
+        analysis = self._cached_analysis(key)
+        if analysis != None:
+            return analysis
+
+        if self.search_stopped:
+            return None
+
+        # Run as a background analysis so the search can stop it once the result is no longer needed
+        # Started outside the lock, since the first analysis of a game waits for the engine to clear its hash
+        analysis = engine.analysis(board, limit, multipv=num_pv, game=self.game)
+        with self.search_lock:
+            self.search_analyses.append(analysis)
+            # The search may have stopped while the analysis was starting
+            if self.search_stopped:
+                analysis.stop()
+
+        try:
+            analysis.wait()
+        finally:
+            with self.search_lock:
+                self.search_analyses.remove(analysis)
+                stopped = self.search_stopped
+
+        # A stopped analysis is incomplete, so it is not cached
+        if stopped:
+            return None
+
+        return self._store_analysis(key, analysis.multipv)
+
+    def _stop_search(self, futures: list) -> None:
+        """Cancel the search analyses that have not started and stop the ones still running."""
+        for future in futures:
+            future.cancel()
+
+        with self.search_lock:
+            self.search_stopped = True
+            for analysis in self.search_analyses:
+                analysis.stop()
+
+        # Wait until the engines are free again, raising any error from the stopped analyses
+        for future in futures:
+            if not future.cancelled():
+                future.result()
+
+    def _analyse(self, engine: chess.engine.SimpleEngine, board: chess.Board, limit: chess.engine.Limit, num_pv: int) -> list[dict]:
+        """Analyse a position with the given engine, reusing a cached analysis of the same position if there is one."""
+        key = self._analysis_key(board, limit, num_pv)
+        analysis = self._cached_analysis(key)
+        if analysis != None:
+            return analysis
+
+        return self._store_analysis(key, engine.analyse(board, limit, multipv=num_pv, game=self.game))
+
+    def _cached_analysis(self, key: tuple) -> list[dict]:
+        """Get an analysis from the analysis cache, or None if it is not cached."""
+        with self.analysis_cache_lock:
+            analysis = self.analysis_cache.get(key)
+            if analysis != None:
+                self.analysis_cache.move_to_end(key)
+            return analysis
+
+    def _analysis_key(self, board: chess.Board, limit: chess.engine.Limit, num_pv: int) -> tuple:
+        """Calculate the analysis cache key for a position."""
+        return (board._transposition_key(), self.engine_colour, limit.depth, limit.nodes, limit.time, num_pv)
+
+    def _store_analysis(self, key: tuple, infos: list[dict]) -> list[dict]:
+        """Store an engine analysis in the analysis cache and return the stored version."""
+        # Only the principal variations and scores are used, so only they are kept
+        # Scores are converted once to centipawns from the engine's point of view
+        analysis = [{"pv": info["pv"], "score": info["score"].pov(self.engine_colour).score(mate_score=100000)} for info in infos]
+        with self.analysis_cache_lock:
+            self.analysis_cache[key] = analysis
+            if len(self.analysis_cache) > ANALYSIS_CACHE_SIZE:
+                self.analysis_cache.popitem(last=False)
+
+        return analysis
+
+    def _position_tactic_check(self, board: chess.Board, engine_move: chess.Move) -> int:
+        """Check if the given move sequence contains a tactical opportunity."""
+        tactic_type, _ = TacticSearch.all_tactics(board, engine_move, self.check_fork, self.check_skewer,
+                                                  self.check_absolute_pin, self.check_relative_pin)
+        return tactic_type
     
     def reset_engine(self, board: chess.Board, engine_colour: chess.Color) -> None:
         """Reset the engine with a new board and colour."""
-        self.engine.quit()
+        # The cache is cleared below, so the background analysis is not worth finishing
+        self._cancel_prefetch()
         self.board = board
-        self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
-        self.optimum_engine_settings()
+        # Keep the engine processes running, a new game token makes them start a new game
+        self.game = object()
+        # Only engines whose process has exited are started again
+        restarted = False
+        if self.engine.protocol.returncode.done():
+            self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+            restarted = True
+        for index, engine in enumerate(self.engines):
+            if engine.protocol.returncode.done():
+                self.engines[index] = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+                restarted = True
+        if restarted:
+            self.optimum_engine_settings()
+        # tactic_search waits for its pool analyses before returning, so nothing can refill the cache after this
+        with self.analysis_cache_lock:
+            self.analysis_cache.clear()
+        self.tactic_cache.clear()
         self.engine_colour = engine_colour
         self.current_tactic = None
 
     def close(self) -> None:
-        """Close the engine process."""
-        self.engine.quit()
+        """Close the engine processes."""
+        self._cancel_prefetch()
+        self.executor.shutdown()
+        for engine in [self.engine] + self.engines:
+            if not engine.protocol.returncode.done():
+                engine.quit()
 
 class TacticSearch:
     """Static methods for detecting different types of chess tactics."""
@@ -320,17 +570,26 @@ class TacticSearch:
     def absolute_pinner(board: chess.Board, colour: chess.Color, square: chess.Square) -> chess.Square:
         """Calculate the pinning square for a potential absolute pin. Modified version of python-chess pin_mask function."""
         king = board.king(colour)
-        square_mask = chess.BB_SQUARES[square]
+        # Pieces not on a common file, rank or diagonal with the king cannot be pinned
+        if not chess.BB_RAYS[king][square]:
+            return None
 
-        for attacks, sliders in [(chess.BB_FILE_ATTACKS, board.rooks | board.queens),
-                                 (chess.BB_RANK_ATTACKS, board.rooks | board.queens),
-                                 (chess.BB_DIAG_ATTACKS, board.bishops | board.queens)]:
+        square_mask = chess.BB_SQUARES[square]
+        # Bitboards used for every ray, read from the board once
+        rooks_queens = board.rooks | board.queens
+        bishops_queens = board.bishops | board.queens
+        enemy = board.occupied_co[not colour]
+        blockers = board.occupied | square_mask
+
+        for attacks, sliders in ((chess.BB_FILE_ATTACKS, rooks_queens),
+                                 (chess.BB_RANK_ATTACKS, rooks_queens),
+                                 (chess.BB_DIAG_ATTACKS, bishops_queens)):
             rays = attacks[king][0]
             if rays & square_mask:
-                snipers = rays & sliders & board.occupied_co[not colour]
+                snipers = rays & sliders & enemy
                 for sniper in chess.scan_reversed(snipers):
                     # If the square is the only thing in between piece and sniper
-                    if chess.between(sniper, king) & (board.occupied | square_mask) == square_mask:
+                    if BETWEEN[sniper][king] & blockers == square_mask:
                         return sniper
 
                 break
@@ -338,19 +597,49 @@ class TacticSearch:
         # No pin found
         return None
 
+    @staticmethod
+    def absolute_pins(board: chess.Board, colour: chess.Color) -> dict:
+        """Map every piece pinned to the king of the given colour to the square of its pinner."""
+        pins = {}
+        king = board.king(colour)
+        if king == None:
+            return pins
+
+        own = board.occupied_co[colour]
+        enemy = board.occupied_co[not colour]
+        occupied = board.occupied
+
+        for attacks, sliders in ((chess.BB_FILE_ATTACKS, board.rooks | board.queens),
+                                 (chess.BB_RANK_ATTACKS, board.rooks | board.queens),
+                                 (chess.BB_DIAG_ATTACKS, board.bishops | board.queens)):
+            snipers = attacks[king][0] & sliders & enemy
+            for sniper in chess.scan_reversed(snipers):
+                # A single friendly piece between sniper and king is pinned
+                blockers = BETWEEN[sniper][king] & occupied
+                if blockers & own and not blockers & (blockers - 1):
+                    pins[chess.lsb(blockers)] = sniper
+
+        return pins
+
     @staticmethod
     def relative_pinner(board: chess.Board, colour: chess.Color, square: chess.Square, piece: chess.Square) -> chess.Square:
         """Calculate the pinning square for a potential relative pin. Modified version of python-chess pin_mask function."""
+        # Callers only pass squares on a common file, rank or diagonal
         square_mask = chess.BB_SQUARES[square]
-
-        for attacks, sliders in [(chess.BB_FILE_ATTACKS, board.rooks | board.queens),
-                                (chess.BB_RANK_ATTACKS, board.rooks | board.queens),
-                                (chess.BB_DIAG_ATTACKS, board.bishops | board.queens)]:
+        # Bitboards used for every ray, read from the board once
+        rooks_queens = board.rooks | board.queens
+        bishops_queens = board.bishops | board.queens
+        enemy = board.occupied_co[not colour]
+        blockers = board.occupied | square_mask
+
+        for attacks, sliders in ((chess.BB_FILE_ATTACKS, rooks_queens),
+                                 (chess.BB_RANK_ATTACKS, rooks_queens),
+                                 (chess.BB_DIAG_ATTACKS, bishops_queens)):
             rays = attacks[piece][0]
             if rays & square_mask:
-                snipers = rays & sliders & board.occupied_co[not colour]
+                snipers = rays & sliders & enemy
                 for sniper in chess.scan_reversed(snipers):
-                    if chess.between(piece, sniper) & (board.occupied | square_mask) == square_mask:
+                    if BETWEEN[piece][sniper] & blockers == square_mask:
                         return sniper
                     
                 break
@@ -359,135 +648,244 @@ class TacticSearch:
         return None
 
     @staticmethod
-    def absolute_pin(board: chess.Board, next_move: chess.Move) -> list:
+    def changed_squares(board: chess.Board) -> chess.Bitboard:
+        """Calculate a bitboard covering every square changed by the last move."""
+        last_move = board.peek()
+        changed = chess.BB_SQUARES[last_move.from_square] | chess.BB_SQUARES[last_move.to_square]
+        moved_type = board.piece_type_at(last_move.to_square)
+
+        # Castling also moves a rook along the back rank
+        if moved_type == chess.KING:
+            changed |= chess.BB_RANKS[chess.square_rank(last_move.from_square)]
+        # En passant removes a pawn beside the moving pawn
+        elif moved_type == chess.PAWN and chess.square_file(last_move.from_square) != chess.square_file(last_move.to_square):
+            changed |= chess.BB_SQUARES[chess.square(chess.square_file(last_move.to_square), chess.square_rank(last_move.from_square))]
+
+        return changed
+
+    @staticmethod
+    def pin_possible(board: chess.Board, changed: chess.Bitboard) -> bool:
+        """Check if the squares changed by the last move are on a line with a slider that could pin."""
+        enemy = board.occupied_co[not board.turn]
+        rooks_queens = (board.rooks | board.queens) & enemy
+        bishops_queens = (board.bishops | board.queens) & enemy
+
+        # A new pin needs a changed square on the pin line, including the pinner's own square
+        for square in chess.scan_reversed(changed):
+            square_mask = chess.BB_SQUARES[square]
+            if (chess.BB_RANK_ATTACKS[square][0] | chess.BB_FILE_ATTACKS[square][0] | square_mask) & rooks_queens:
+                return True
+            if (chess.BB_DIAG_ATTACKS[square][0] | square_mask) & bishops_queens:
+                return True
+
+        return False
+
+    @staticmethod
+    def all_tactics(board: chess.Board, next_move: chess.Move, check_fork: bool = True, check_skewer: bool = True,
+                    check_absolute_pin: bool = True, check_relative_pin: bool = True) -> tuple:
+        """Detect the first enabled tactic in the position, checked in order of priority."""
+        if not board.move_stack:
+            return -1, []
+
+        if check_fork:
+            forked_pieces = TacticSearch.fork(board, next_move)
+            if forked_pieces:
+                return TACTIC_TYPES["Fork"], forked_pieces
+
+        if check_skewer:
+            skewered_pieces = TacticSearch.skewer(board, next_move)
+            if skewered_pieces:
+                return TACTIC_TYPES["Skewer"], skewered_pieces
+
+        if not (check_absolute_pin or check_relative_pin):
+            return -1, []
+
+        # Both pin checks share the squares changed by the last move
+        changed = TacticSearch.changed_squares(board)
+        if not TacticSearch.pin_possible(board, changed):
+            return -1, []
+
+        if check_absolute_pin:
+            pinned_pieces = TacticSearch.absolute_pin(board, next_move, changed)
+            if pinned_pieces:
+                return TACTIC_TYPES["Absolute Pin"], pinned_pieces
+
+        if check_relative_pin:
+            pinned_pieces = TacticSearch.relative_pin(board, next_move, changed)
+            if pinned_pieces:
+                return TACTIC_TYPES["Relative Pin"], pinned_pieces
+
+        return -1, []
+
+    @staticmethod
+    def absolute_pin(board: chess.Board, next_move: chess.Move, changed: chess.Bitboard = None) -> list:
         """Detect absolute pins (pinned to king)."""
         if not board.move_stack:
             return []
 
-        # Previous position
-        last_position = board.copy()
-        last_position.pop()
-        # Find all pieces except kings
-        filtered_pieces = board.occupied_co[board.turn] & ~board.kings
-        
-        # Check each piece for a pin
-        for square in chess.scan_reversed(filtered_pieces):
-            pinning_square = TacticSearch.absolute_pinner(board, board.turn, square)
-            last_pos_pin = TacticSearch.absolute_pinner(last_position, board.turn, square)
+        if changed == None:
+            changed = TacticSearch.changed_squares(board)
+        colour = board.turn
+        opponent = not colour
+        king = board.king(colour)
+        # Find every pinned piece in one pass over the sliders lined up with the king
+        pins = TacticSearch.absolute_pins(board, colour)
+        if not pins:
+            return []
+        pinned_pieces = 0
+        for square in pins:
+            pinned_pieces |= chess.BB_SQUARES[square]
+
+        # Check each pinned piece
+        for square in chess.scan_reversed(pinned_pieces):
+            pinning_square = pins[square]
+
+            # If the last move did not touch the pin line, the pin was already present
+            if not (BETWEEN[king][pinning_square] | chess.BB_SQUARES[pinning_square]) & changed:
+                continue
+
+            # Look at the previous position by taking back the last move on the board itself
+            last_move = board.pop()
+            try:
+                last_pos_pin = TacticSearch.absolute_pinner(board, colour, square)
+            finally:
+                board.push(last_move)
 
             # If the pin was not present in the last position, move is a new pin
-            if pinning_square != None and last_pos_pin == None:
-                pinning = board.piece_at(pinning_square)
-                pinned = board.piece_at(square)
+            if last_pos_pin == None:
+                pinning_value = PIECE_VALUES[board.piece_type_at(pinning_square)]
+                pinned_value = PIECE_VALUES[board.piece_type_at(square)]
 
                 # If pin can be broken by capturing the pinning piece, not a good pin
                 if next_move != None:
                     if next_move.to_square == pinning_square:
-                        defenders = board.attackers(not board.turn, pinning_square)
-                        if len(defenders) == 0:
+                        if not board.attackers_mask(opponent, pinning_square):
                             continue
 
                 # If the pinning piece is worth less than the pinned piece, good pin
-                if PIECE_VALUES[pinning.piece_type] < PIECE_VALUES[pinned.piece_type]:
+                if pinning_value < pinned_value:
                     return [square]
 
                 # If the pinned piece is defended poorly, good pin
-                attackers = board.attackers(not board.turn, square)
-                defenders = board.attackers(board.turn, square)
-                if len(attackers) > len(defenders):
+                attackers = board.attackers_mask(opponent, square)
+                defenders = board.attackers_mask(colour, square)
+                if chess.popcount(attackers) > chess.popcount(defenders):
                     return [square]
 
                 # Pinned piece was a crucial defender of another piece under attack, good pin
-                defending = board.attacks(square) & board.occupied_co[board.turn]
-                if len(defending) > 0:
-                    for ally in defending:
-                        if board.is_attacked_by(not board.turn, ally):
-                            attackers = board.attackers(not board.turn, ally)
-                            defenders = board.attackers(board.turn, ally)
+                defending = board.attacks_mask(square) & board.occupied_co[colour]
+                for ally in chess.scan_reversed(defending):
+                    attackers = board.attackers_mask(opponent, ally)
+                    # Only allies under attack need the pinned piece as a defender
+                    if attackers:
+                        defenders = board.attackers_mask(colour, ally)
 
-                            # Do not include pinner as attacker
-                            if pinning_square in attackers:
-                                attackers.remove(pinning_square)
+                        # Do not include pinner as attacker
+                        attackers &= ~chess.BB_SQUARES[pinning_square]
 
-                            # Do not include pinned piece as defender
-                            defenders.remove(square)
+                        # Do not include pinned piece as defender
+                        defenders &= ~chess.BB_SQUARES[square]
 
-                            if len(attackers) > len(defenders):
-                                return [square]
+                        if chess.popcount(attackers) > chess.popcount(defenders):
+                            return [square]
                             
         return []
     
     @staticmethod
-    def relative_pin(board: chess.Board, next_move: chess.Move) -> list:
+    def relative_pin(board: chess.Board, next_move: chess.Move, changed: chess.Bitboard = None) -> list:
         if not board.move_stack:
             return []
         
-        # Previous position
-        last_position = board.copy()
-        last_position.pop()
-        valued_pieces = board.occupied_co[board.turn] & ~board.kings & ~board.pawns
-        pinnable_pieces = board.occupied_co[board.turn] & ~board.kings
+        if changed == None:
+            changed = TacticSearch.changed_squares(board)
+        colour = board.turn
+        opponent = not colour
+        valued_pieces = board.occupied_co[colour] & ~board.kings & ~board.pawns
+        pinnable_pieces = board.occupied_co[colour] & ~board.kings
+        occupied = board.occupied
+        enemy = board.occupied_co[opponent]
+        rooks_queens = (board.rooks | board.queens) & enemy
+        bishops_queens = (board.bishops | board.queens) & enemy
         
         # Check valuable pieces that could be targets for relative pins
         for valued_square in chess.scan_reversed(valued_pieces):
-            valuable = board.piece_at(valued_square)
-            # Search through all potential pinned pieces for this piece
-            for pin_square in chess.scan_reversed(pinnable_pieces):
-                # Skip if the piece is the same
-                if valued_square == pin_square:
-                    continue
+            # Only the nearest piece on each line from the valuable piece can be pinned to it,
+            # and only on lines that hold an enemy slider moving along them, so every candidate is aligned with it
+            nearest = 0
+            if chess.BB_FILE_ATTACKS[valued_square][0] & rooks_queens:
+                nearest |= chess.BB_FILE_ATTACKS[valued_square][chess.BB_FILE_MASKS[valued_square] & occupied]
+            if chess.BB_RANK_ATTACKS[valued_square][0] & rooks_queens:
+                nearest |= chess.BB_RANK_ATTACKS[valued_square][chess.BB_RANK_MASKS[valued_square] & occupied]
+            if chess.BB_DIAG_ATTACKS[valued_square][0] & bishops_queens:
+                nearest |= chess.BB_DIAG_ATTACKS[valued_square][chess.BB_DIAG_MASKS[valued_square] & occupied]
+            nearest &= pinnable_pieces
+            if not nearest:
+                continue
 
-                pinned = board.piece_at(pin_square)
+            valuable_value = PIECE_VALUES[board.piece_type_at(valued_square)]
+            # Search through all potential pinned pieces for this piece
+            for pin_square in chess.scan_reversed(nearest):
+                pinned_value = PIECE_VALUES[board.piece_type_at(pin_square)]
                 # Skip if the pinned piece is worth more than the valuable piece
-                if PIECE_VALUES[pinned.piece_type] > PIECE_VALUES[valuable.piece_type]:
+                if pinned_value > valuable_value:
                     continue
 
                 # Check if the piece is pinned
-                pinning_square = TacticSearch.relative_pinner(board, board.turn, pin_square, valued_square)
-                last_pos_pin = TacticSearch.relative_pinner(last_position, board.turn, pin_square, valued_square)
+                pinning_square = TacticSearch.relative_pinner(board, colour, pin_square, valued_square)
+                if pinning_square == None:
+                    continue
+
+                # If the last move did not touch the pin line, the pin was already present
+                if not (BETWEEN[valued_square][pinning_square] | chess.BB_SQUARES[pinning_square]) & changed:
+                    continue
+
+                # Look at the previous position by taking back the last move on the board itself
+                last_move = board.pop()
+                try:
+                    last_pos_pin = TacticSearch.relative_pinner(board, colour, pin_square, valued_square)
+                finally:
+                    board.push(last_move)
 
                 # If the pin was not present in the last position, move is a new pin
-                if pinning_square != None and last_pos_pin == None:
-                    pinning = board.piece_at(pinning_square)
+                if last_pos_pin == None:
+                    pinning_value = PIECE_VALUES[board.piece_type_at(pinning_square)]
 
                     # If pin can be broken by capturing the pinning piece, not a good pin
                     if next_move != None:
                         if next_move.to_square == pinning_square:
-                            defenders = board.attackers(not board.turn, pinning_square)
-                            if len(defenders) == 0:
+                            if not board.attackers_mask(opponent, pinning_square):
                                 continue
 
                     # Skip if the pinning piece is worth more than or equal to valuable piece
-                    if PIECE_VALUES[pinning.piece_type] >= PIECE_VALUES[valuable.piece_type]:
+                    if pinning_value >= valuable_value:
                         continue
                     
                     # Good pin if the pinning piece is worth less than the pinned piece
-                    if PIECE_VALUES[pinning.piece_type] < PIECE_VALUES[pinned.piece_type]:
+                    if pinning_value < pinned_value:
                         return [pin_square]
 
                     # Check if there are more attackers than defenders on the pinned piece
-                    attackers = board.attackers(not board.turn, pin_square)
-                    defenders = board.attackers(board.turn, pin_square)
-                    if len(attackers) > len(defenders):
+                    attackers = board.attackers_mask(opponent, pin_square)
+                    defenders = board.attackers_mask(colour, pin_square)
+                    if chess.popcount(attackers) > chess.popcount(defenders):
                         return [pin_square]
 
                     # If the pinned piece was a crucial defender of another piece under attack, good pin
-                    defending = board.attacks(pin_square) & board.occupied_co[board.turn]
-                    if len(defending) > 0:
-                        for ally in defending:
-                            if board.is_attacked_by(not board.turn, ally):
-                                attackers = board.attackers(not board.turn, ally)
-                                defenders = board.attackers(board.turn, ally)
-
-                                # Do not include pinner as attacker
-                                if pinning_square in attackers:
-                                    attackers.remove(pinning_square)
-
-                                # Do not include pinned piece as defender
-                                defenders.remove(pin_square)
-                                
-                                if len(attackers) > len(defenders):
-                                    return [pin_square]
+                    defending = board.attacks_mask(pin_square) & board.occupied_co[colour]
+                    for ally in chess.scan_reversed(defending):
+                        attackers = board.attackers_mask(opponent, ally)
+                        # Only allies under attack need the pinned piece as a defender
+                        if attackers:
+                            defenders = board.attackers_mask(colour, ally)
+
+                            # Do not include pinner as attacker
+                            attackers &= ~chess.BB_SQUARES[pinning_square]
+
+                            # Do not include pinned piece as defender
+                            defenders &= ~chess.BB_SQUARES[pin_square]
+                            
+                            if chess.popcount(attackers) > chess.popcount(defenders):
+                                return [pin_square]
 
         return []
     
@@ -496,52 +894,64 @@ class TacticSearch:
         if not board.move_stack:
             return []
         
-        valuable_pieces = board.occupied_co[board.turn] & ~board.pawns
-        other_pieces = board.occupied_co[board.turn] & ~board.kings
+        colour = board.turn
+        opponent = not colour
+        piece_type_at = board.piece_type_at
+        valuable_pieces = board.occupied_co[colour] & ~board.pawns
+        other_pieces = board.occupied_co[colour] & ~board.kings
+        # Valuable squares and their values are the same for every skewered piece, so read them once
+        valued_pieces = [(square, PIECE_VALUES[piece_type_at(square)]) for square in chess.scan_reversed(valuable_pieces)]
 
         for skewered_square in chess.scan_reversed(other_pieces):
-            skewered = board.piece_at(skewered_square)
+            skewered_value = PIECE_VALUES[piece_type_at(skewered_square)]
+            skewered_rays = chess.BB_RAYS[skewered_square]
 
-            for valued_square in chess.scan_reversed(valuable_pieces):
-                valued = board.piece_at(valued_square)
+            for valued_square, valued_value in valued_pieces:
                 # Skip if the piece is the same
                 if skewered_square == valued_square:
                     continue
 
                 # Skip if the skewered piece is worth more than the valuable piece
-                if PIECE_VALUES[skewered.piece_type] > PIECE_VALUES[valued.piece_type]:
+                if skewered_value > valued_value:
+                    continue
+
+                # Pieces not on a common file, rank or diagonal cannot be skewered
+                if not skewered_rays[valued_square]:
                     continue
 
-                skewering_square = TacticSearch.relative_pinner(board, board.turn, valued_square, skewered_square)
+                skewering_square = TacticSearch.relative_pinner(board, colour, valued_square, skewered_square)
                 if skewering_square != None:
-                    skewering = board.piece_at(skewering_square)
+                    skewering_value = PIECE_VALUES[piece_type_at(skewering_square)]
 
                     # Skip if the skewering piece is worth more than or equal to the valued piece
-                    if PIECE_VALUES[skewering.piece_type] >= PIECE_VALUES[valued.piece_type]:
+                    if skewering_value >= valued_value:
                         continue
 
                     if next_move != None:
                         # Skip if the skewering piece can be captured
                         if next_move.to_square == skewering_square:
-                            defenders = board.attackers(not board.turn, skewered_square)
+                            defenders = board.attackers_mask(opponent, skewered_square)
 
-                            if len(defenders) == 0:
+                            if not defenders:
                                 return []
                         
                     # Good skewer if the skewered piece is worth more than the skewering piece
-                    if PIECE_VALUES[skewering.piece_type] < PIECE_VALUES[skewered.piece_type]:
+                    if skewering_value < skewered_value:
                         return [skewered_square]
                     
                     if next_move == None:
                         return [skewered_square]
 
-                    temp_board = board.copy(stack=1)
-                    temp_board.push(next_move)
+                    # Play the next move on the board itself and undo it afterwards
+                    board.push(next_move)
+                    try:
+                        attackers = board.attackers_mask(opponent, skewered_square)
+                        defenders = board.attackers_mask(colour, skewered_square)
+                    finally:
+                        board.pop()
 
                     # More attackers than defenders on the skewered piece, good skewer
-                    attackers = temp_board.attackers(temp_board.turn, skewered_square)
-                    defenders = temp_board.attackers(not temp_board.turn, skewered_square)
-                    if len(attackers) > len(defenders):
+                    if chess.popcount(attackers) > chess.popcount(defenders):
                         return [skewered_square]
                     
         return []
@@ -552,45 +962,48 @@ class TacticSearch:
         if not board.move_stack:
             return []
 
+        colour = board.turn
+        opponent = not colour
+
         # Get the move that the forking piece has made
         forking_move = board.peek()
 
         # Check if the forking piece is captured in the next move
         if next_move != None:
             if next_move.to_square == forking_move.to_square:
-                defenders = board.attackers(not board.turn, forking_move.to_square)
-                if len(defenders) == 0:
+                defenders = board.attackers_mask(opponent, forking_move.to_square)
+                if not defenders:
                     return []
 
         # Generate the pieces that the forking piece is attacking
-        attacked_pieces = board.attacks(forking_move.to_square) & board.occupied_co[board.turn]
+        attacked_pieces = board.attacks_mask(forking_move.to_square) & board.occupied_co[colour]
         # Attacking less than two pieces, not a fork
-        if len(attacked_pieces) < 2:
+        if chess.popcount(attacked_pieces) < 2:
             return []
 
         # Check if the attacked pieces are defended
-        forking_piece = board.piece_at(forking_move.to_square)
+        forking_value = PIECE_VALUES[board.piece_type_at(forking_move.to_square)]
         forked_pieces = []
         king_forked = False
 
-        for square in attacked_pieces:
-            target_piece = board.piece_at(square)
+        for square in chess.scan_forward(attacked_pieces):
+            target_type = board.piece_type_at(square)
 
             # A king is always a good fork target since it means the fork is forceful
-            if target_piece.piece_type == chess.KING:
+            if target_type == chess.KING:
                 king_forked = True
                 forked_pieces.append(square)
                 continue
 
             # A more valuable piece than the attacking forker is a good target
-            if PIECE_VALUES[target_piece.piece_type] > PIECE_VALUES[forking_piece.piece_type]:
+            if PIECE_VALUES[target_type] > forking_value:
                 forked_pieces.append(square)
                 continue
             
-            attackers = board.attackers(not board.turn, square)
-            defenders = board.attackers(board.turn, square)
+            attackers = board.attackers_mask(opponent, square)
+            defenders = board.attackers_mask(colour, square)
             # If the square has more attackers than defenders, it's a good target
-            if len(attackers) > len(defenders):
+            if chess.popcount(attackers) > chess.popcount(defenders):
                 forked_pieces.append(square)
 
         # Not a good fork if less than two pieces are forked and no king is forked
@@ -604,32 +1017,35 @@ class TacticSearch:
             return forked_pieces
 
         # Check next move in sequence to ensure validity (forked pieces may move to defend eachother in best sequence)
-        if next_move.from_square not in attacked_pieces:
+        if not attacked_pieces & chess.BB_SQUARES[next_move.from_square]:
             return forked_pieces
 
-        temp_board = board.copy(stack=False)
-        temp_board.push(next_move)
+        # Play the next move on the board itself and undo it afterwards
+        board.push(next_move)
         next_forked_pieces = []
-        
-        # Remove the piece that was moved from the attacked pieces
-        attacked_pieces.remove(next_move.from_square)
-        # Check if the piece that was moved is still attacked by the forking piece
-        if next_move.to_square in temp_board.attacks(forking_move.to_square):
-            attacked_pieces.add(next_move.to_square)
-
-        for square in attacked_pieces:
-            attackers = temp_board.attackers(temp_board.turn, square)
-            defenders = temp_board.attackers(not temp_board.turn, square)
-
-            # If the square has more attackers than defenders, it's a good target
-            if len(attackers) > len(defenders):
-                next_forked_pieces.append(square)
-            else:
-                # Check if the attacked square is attacked by a less valuable piece
-                for attacker in attackers:
-                    if PIECE_VALUES[temp_board.piece_at(attacker).piece_type] < PIECE_VALUES[temp_board.piece_at(square).piece_type]:
-                        next_forked_pieces.append(square)
-                        break
+        try:
+            # Remove the piece that was moved from the attacked pieces
+            attacked_pieces &= ~chess.BB_SQUARES[next_move.from_square]
+            # Check if the piece that was moved is still attacked by the forking piece
+            if board.attacks_mask(forking_move.to_square) & chess.BB_SQUARES[next_move.to_square]:
+                attacked_pieces |= chess.BB_SQUARES[next_move.to_square]
+
+            for square in chess.scan_forward(attacked_pieces):
+                attackers = board.attackers_mask(opponent, square)
+                defenders = board.attackers_mask(colour, square)
+
+                # If the square has more attackers than defenders, it's a good target
+                if chess.popcount(attackers) > chess.popcount(defenders):
+                    next_forked_pieces.append(square)
+                else:
+                    # Check if the attacked square is attacked by a less valuable piece
+                    target_value = PIECE_VALUES[board.piece_type_at(square)]
+                    for attacker in chess.scan_reversed(attackers):
+                        if PIECE_VALUES[board.piece_type_at(attacker)] < target_value:
+                            next_forked_pieces.append(square)
+                            break
+        finally:
+            board.pop()
 
         # Unable to capture any of the forked pieces in the next move, not a good fork
         if len(next_forked_pieces) < 1: